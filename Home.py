@@ -1,4 +1,5 @@
 import streamlit as st
+from datos import cargar_resumen, comprobar_fuentes
 
 # 1. Configuración de la página (Título, icono y diseño ancho)
 st.set_page_config(
@@ -19,11 +20,37 @@ Esta aplicación centraliza todas las herramientas de análisis para la gestión
 Utiliza el **menú de la izquierda** para navegar entre las diferentes herramientas disponibles.
 """)
 
-# 4. (Opcional) Puedes poner una imagen bonita o métricas rápidas aquí
+# 4. Métricas rápidas (resumen precalculado: no se conecta a Google Sheets ni lee Excels)
+resumen = cargar_resumen()
+
+def formato_metrica(valor, sufijo=""):
+    return "—" if valor is None else f"{valor}{sufijo}"
+
+st.subheader("📌 Situación actual")
+m1, m2, m3, m4 = st.columns(4)
+m1.metric("Último Pick Up", formato_metrica(resumen.get("pickup")), delta=resumen.get("pickup"))
+m2.metric("Ocupación OTB 30 días", formato_metrica(resumen.get("otb_30"), "%"))
+m3.metric("Ocupación OTB 90 días", formato_metrica(resumen.get("otb_90"), "%"))
+m4.metric(
+    f"RevPAR última temporada {resumen.get('anio_temporada', '')}".strip(),
+    formato_metrica(resumen.get("revpar_temporada"), "€")
+)
+
+if resumen.get("snapshot"):
+    st.caption(f"Pick Up y ocupación del snapshot **{resumen['snapshot']}** · RevPAR de la última temporada del Excel de KPI's anuales.")
+
 col1, col2 = st.columns(2)
 
 with col1:
     st.info("💡 **Tip:** Puedes ocultar el menú de navegación haciendo clic en la 'X' arriba a la izquierda.")
 
 with col2:
-    st.success("✅ **Estado del sistema:** Todos los scripts están operativos.")
\ No newline at end of file
+    if resumen:
+        actualizado = resumen.get("actualizado_historial") or resumen.get("actualizado_kpis")
+        st.success(f"✅ **Estado del sistema:** Resumen actualizado el {actualizado}.")
+    else:
+        st.warning("⚠️ **Estado del sistema:** Aún no hay resumen. Abre *Revenue Management* o *KPI's anuales* para generarlo.")
+
+    if st.button("🩺 Comprobar fuentes de datos"):
+        with st.spinner("Midiendo cada fuente..."):
+            st.dataframe(comprobar_fuentes(), hide_index=True, use_container_width=True)
@@ -0,0 +1,690 @@
+"""
+Capa de acceso a datos compartida por todas las páginas.
+
+- Una única conexión a Google Sheets por proceso (reutilizada entre páginas y sesiones).
+- Un historial compartido y versionado por todas las sesiones; los guardados se serializan
+  (bloqueo entre sesiones y procesos) y las demás sesiones reciben la nueva versión sin descargarla.
+- Un pool de hilos para solapar trabajo pesado (p.ej. parsear un Excel) con la descarga del historial.
+- Índice de ritmo por antelación para comparar con el año anterior (STLY).
+- Validación vectorizada de lo que se importa (InformeValidacion) antes de que llegue al historial.
+- Un resumen precalculado (JSON local) con los KPIs de la portada, que se refresca al importar datos.
+- Si existe la variable de entorno CAMPING_BI_SHEETS_DIR se usa una carpeta local de CSVs
+  en lugar de Google Sheets (útil para desarrollo y pruebas sin conexión).
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo bloqueo entre hilos
+    fcntl = None
+
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+# --- CONFIGURACIÓN ---
+# Inventario (Capacidad total)
+INVENTARIO_TOTAL = {
+    'N-4': 30,
+    'N-6': 10,
+    'ST2': 2,
+    'ST4': 5,
+    'ST5': 5
+}
+
+# Nombre de la hoja dentro de tu Google Sheet (pestaña inferior)
+HOJA_DB = "Datos"  # Asegúrate de que coincida con tu Google Sheet
+
+# Compactación: cada snapshot solo guarda las celdas que cambian respecto al anterior
+COMPACTAR_HISTORIAL = True
+# Snapshots más antiguos que esto (respecto al último) se reducen a uno por semana
+DIAS_RETENCION_DIARIA = 90
+
+CLAVE_HISTORIAL = ['fecha_estancia', 'tipo_alojamiento']
+COLUMNAS_HISTORIAL = ['fecha_estancia', 'tipo_alojamiento', 'cantidad', 'fecha_snapshot']
+
+# Rango razonable de una estancia respecto a su snapshot (fuera de él se avisa)
+DIAS_ESTANCIA_ANTES = 400
+DIAS_ESTANCIA_DESPUES = 800
+
+# Segundos que el historial descargado se considera fresco
+TTL_LECTURA = 600
+
+# STLY (same time last year): 52 semanas atrás para comparar el mismo día de la semana
+DIAS_ANIO_ANTERIOR = 364
+
+# Resumen precalculado para la portada (Home.py)
+RUTA_RESUMEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".camping_bi", "resumen.json")
+
+# Guardados del historial: bloqueo entre procesos (varias instancias de la app en la misma máquina)
+RUTA_BLOQUEO = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".camping_bi", "historial.lock")
+
+# --- CONEXIONES ---
+
+class ConexionLocal:
+    """Imita la interfaz read/update de GSheetsConnection guardando cada hoja como un CSV."""
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        os.makedirs(carpeta, exist_ok=True)
+
+    def _ruta(self, worksheet):
+        return os.path.join(self.carpeta, f"{worksheet}.csv")
+
+    def read(self, worksheet, **kwargs):
+        ruta = self._ruta(worksheet)
+        if not os.path.exists(ruta):
+            return pd.DataFrame()
+        return pd.read_csv(ruta)
+
+    def update(self, worksheet, data):
+        data.to_csv(self._ruta(worksheet), index=False)
+        return data
+
+@st.cache_resource(show_spinner=False)
+def obtener_conexion():
+    """Conexión compartida por todo el proceso."""
+    carpeta_local = os.environ.get("CAMPING_BI_SHEETS_DIR")
+    if carpeta_local:
+        return ConexionLocal(carpeta_local)
+
+    from streamlit_gsheets import GSheetsConnection
+    return st.connection("gsheets", type=GSheetsConnection)
+
+@st.cache_resource(show_spinner=False)
+def _pool_hilos():
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="camping-bi")
+
+def en_segundo_plano(funcion, *args, **kwargs):
+    """
+    Lanza la función en el pool compartido y devuelve su Future.
+    Solo para trabajo que no llama a Streamlit (parsear Excels, cálculos con pandas...).
+    """
+    return _pool_hilos().submit(funcion, *args, **kwargs)
+
+# --- LECTURA / ESCRITURA ---
+
+def escribir_hoja(hoja, df):
+    """Sube la pestaña completa."""
+    obtener_conexion().update(worksheet=hoja, data=df)
+
+# --- VALIDACIÓN DE DATOS ---
+
+class InformeValidacion:
+    """
+    Acumula los problemas encontrados al importar datos (una fila por control).
+    Cada control es una máscara vectorizada sobre la columna completa; las funciones
+    devuelven la columna ya convertida para no parsear dos veces.
+    """
+
+    def __init__(self):
+        self.problemas = []
+
+    def registrar(self, control, nivel, mascara, valores):
+        """Añade el control al informe si alguna fila lo incumple (nivel: 'error' o 'aviso')."""
+        filas = int(mascara.sum())
+        if filas:
+            ejemplo = ", ".join(valores[mascara].astype(str).fillna("").head(3))
+            self.problemas.append({"Control": control, "Nivel": nivel, "Filas": filas, "Ejemplo": ejemplo})
+
+    def columnas(self, df, requeridas):
+        faltan = [c for c in requeridas if c not in df.columns]
+        if faltan:
+            self.problemas.append({"Control": "Faltan columnas", "Nivel": "error", "Filas": len(faltan), "Ejemplo": ", ".join(faltan)})
+        return not faltan
+
+    def fechas(self, bruto, nombre, desde=None, hasta=None):
+        """Convierte la columna y marca fechas basura, fuera de rango o con día y mes invertidos."""
+        ya_fechas = pd.api.types.is_datetime64_any_dtype(bruto)
+        if ya_fechas:
+            fechas, heuristica = bruto, pd.Series(False, index=bruto.index)
+        else:
+            fechas, heuristica = _parsear_fechas_por_etapas(bruto)
+        self.registrar(f"Fecha no válida ({nombre})", "error", fechas.isna() & bruto.notna(), bruto)
+
+        if heuristica.any():
+            # "05/13/2025" no existe con el día primero y pandas la lee con el mes primero:
+            # el origen mezcla formatos y las fechas ambiguas de esa columna pueden estar invertidas
+            partes = bruto[heuristica].astype(str).str.extract(r'^(\d{1,2})[/.-](\d{1,2})[/.-]\d{2,4}')
+            mes_primero = pd.to_numeric(partes[1], errors='coerce') > 12
+            self.registrar(f"Fecha con el mes primero ({nombre})", "error", mes_primero, bruto[heuristica])
+
+        if desde is not None:
+            fuera = fechas.notna() & ((fechas < desde) | (fechas > hasta))
+            if not ya_fechas and fuera.any():
+                # ¿Leída al revés (mes primero) cae dentro del rango? Entonces casi seguro está invertida
+                alternativa = pd.to_datetime(bruto.where(fuera), dayfirst=False, errors='coerce')
+                invertida = fuera & (alternativa >= desde) & (alternativa <= hasta)
+                self.registrar(f"Día y mes invertidos ({nombre})", "error", invertida, bruto)
+                fuera = fuera & ~invertida
+            self.registrar(f"Fecha fuera de rango ({nombre})", "aviso", fuera, bruto)
+        return fechas
+
+    def numeros(self, bruto, nombre, minimo=0, maximo=None):
+        """Convierte a número y marca valores no numéricos, bajo el mínimo o sobre el máximo (capacidad)."""
+        numeros = pd.to_numeric(bruto, errors='coerce')
+        vacio = bruto.isna() | bruto.astype(str).str.strip().isin(['', 'nan', 'None'])
+        self.registrar(f"Valor no numérico ({nombre})", "error", numeros.isna() & ~vacio, bruto)
+        if minimo is not None:
+            self.registrar(f"Valor menor que {minimo} ({nombre})", "error", numeros < minimo, bruto)
+        if maximo is not None:
+            # Un máximo por fila (Series) es la capacidad de cada tipo de alojamiento
+            control = "Supera la capacidad" if isinstance(maximo, pd.Series) else f"Valor mayor que {maximo}"
+            self.registrar(f"{control} ({nombre})", "error", numeros > maximo, bruto)
+        return numeros
+
+    def duplicados(self, df, clave):
+        mascara = df.duplicated(subset=clave, keep=False)
+        # El ejemplo solo se construye con las filas repetidas
+        repetidas = df.loc[mascara, clave].astype(str).fillna("")
+        valores = repetidas[clave[0]]
+        for col in clave[1:]:
+            valores = valores + " / " + repetidas[col]
+        self.registrar(f"Duplicados ({', '.join(clave)})", "error", mascara[mascara], valores)
+
+    @property
+    def hay_errores(self):
+        return any(p["Nivel"] == "error" for p in self.problemas)
+
+    def tabla(self):
+        return pd.DataFrame(self.problemas, columns=["Control", "Nivel", "Filas", "Ejemplo"])
+
+    def mostrar(self, titulo="🔎 Calidad de datos"):
+        """Informe compacto en un desplegable (abierto si hay errores). No muestra nada si todo está bien."""
+        if not self.problemas:
+            return
+        errores = sum(p["Nivel"] == "error" for p in self.problemas)
+        avisos = len(self.problemas) - errores
+        with st.expander(f"{titulo}: {errores} errores, {avisos} avisos", expanded=self.hay_errores):
+            st.dataframe(self.tabla(), hide_index=True, use_container_width=True)
+
+# --- HISTORIAL DE SNAPSHOTS ---
+
+def parsear_fechas(serie):
+    """
+    Convierte una columna de fechas del Sheet.
+    Las ISO (AAAA-MM-DD, como las escribe esta app) se leen tal cual; el resto con el día primero
+    (formato europeo). errors='coerce': una fecha basura queda vacía (NaT) en lugar de romper.
+    """
+    return _parsear_fechas_por_etapas(serie)[0]
+
+def _parsear_fechas_por_etapas(serie):
+    """Como parsear_fechas, pero devuelve también qué filas necesitaron la heurística de pandas."""
+    fechas = pd.to_datetime(serie, format='ISO8601', errors='coerce')
+    heuristica = pd.Series(False, index=serie.index)
+    # Primero el formato europeo exacto (rápido); lo que quede, con la heurística de pandas
+    for formato in ('%d/%m/%Y', None):
+        resto = fechas.isna() & serie.notna()
+        if not resto.any():
+            break
+        fechas[resto] = pd.to_datetime(serie[resto], format=formato, dayfirst=True, errors='coerce')
+    heuristica = resto if formato is None else heuristica
+    return fechas, heuristica
+
+def _procesar_historial(df_raw):
+    """Convierte fechas y números, valida y reconstruye los snapshots completos."""
+    df = df_raw.copy()
+    informe = InformeValidacion()
+
+    if not df.empty and informe.columnas(df, COLUMNAS_HISTORIAL):
+        # --- CORRECCIÓN FECHAS EUROPEAS ---
+        df['fecha_snapshot'] = informe.fechas(df['fecha_snapshot'], 'fecha_snapshot')
+        # Una estancia muy lejos de su snapshot suele ser un día/mes invertido
+        df['fecha_estancia'] = informe.fechas(
+            df['fecha_estancia'], 'fecha_estancia',
+            desde=df['fecha_snapshot'] - pd.Timedelta(days=DIAS_ESTANCIA_ANTES),
+            hasta=df['fecha_snapshot'] + pd.Timedelta(days=DIAS_ESTANCIA_DESPUES),
+        )
+        df['cantidad'] = informe.numeros(
+            df['cantidad'], 'cantidad', maximo=df['tipo_alojamiento'].map(INVENTARIO_TOTAL)
+        )
+        informe.duplicados(df, ['fecha_snapshot'] + CLAVE_HISTORIAL)
+
+        # Limpiamos filas que hayan quedado con fechas vacías por error
+        df = df.dropna(subset=['fecha_estancia', 'fecha_snapshot'])
+
+        # Si el Sheet está compactado, reconstruimos todos los snapshots completos
+        df = reconstruir_historial(df)
+
+    return df, informe
+
+def huella_datos(df):
+    """Huella del contenido de una hoja: si cambia, alguien ha escrito en ella."""
+    if df.empty:
+        return 0
+    return int(pd.util.hash_pandas_object(df.astype(str), index=False).sum())
+
+# --- HISTORIAL COMPARTIDO ENTRE SESIONES ---
+
+class HistorialCompartido:
+    """
+    Historial en memoria compartido por todas las sesiones del proceso.
+    Las lecturas no bloquean: el estado (versión, historial, informe, huella del historial) se
+    sustituye entero y nunca se modifica, así que quien lo usa no debe modificar el DataFrame.
+    Las descargas y los guardados se serializan con un bloqueo y cada cambio de contenido
+    incrementa la versión.
+    Cuando caduca, lo refresca la primera sesión que consigue el bloqueo; las demás (y las que
+    llegan durante un guardado) siguen leyendo la versión anterior sin esperar.
+    """
+
+    def __init__(self):
+        self.bloqueo = threading.RLock()
+        self.estado = (0, pd.DataFrame(), InformeValidacion(), None)
+        self.huella = None
+        self.cargado_en = None
+
+    def _caducado(self):
+        return self.cargado_en is None or time.monotonic() - self.cargado_en > TTL_LECTURA
+
+    def obtener(self):
+        if self.estado[0] == 0:
+            # Todavía no hay nada que servir: hay que esperar a la primera descarga
+            with self.bloqueo:
+                # Otra sesión puede haberlo descargado mientras esperábamos el bloqueo
+                if self.estado[0] == 0:
+                    self._refrescar()
+        elif self._caducado() and self.bloqueo.acquire(blocking=False):
+            try:
+                if self._caducado():
+                    self._refrescar()
+            finally:
+                self.bloqueo.release()
+        return self.estado
+
+    def _refrescar(self):
+        try:
+            # ttl=0: el caché es este objeto, no el de la conexión
+            df_raw = obtener_conexion().read(worksheet=HOJA_DB, ttl=0)
+        except Exception as e:
+            if self.estado[0] == 0:
+                raise
+            # Sin conexión: seguimos sirviendo la última versión buena y reintentamos más tarde
+            print(f"Error refrescando historial: {e}")
+            self.cargado_en = time.monotonic()
+            return
+
+        huella = huella_datos(df_raw)
+        # Si nadie ha escrito desde la última descarga no hace falta reprocesar
+        if huella != self.huella:
+            self.publicar(df_raw, huella)
+        self.cargado_en = time.monotonic()
+
+    def publicar(self, df_raw, huella=None):
+        """
+        Sustituye el historial compartido (tras un guardado o una descarga con cambios).
+        La versión solo sube si cambia el historial: releer lo que acabamos de guardar no avisa a nadie.
+        """
+        df, informe = _procesar_historial(df_raw)
+        huella_historial = huella_datos(df)
+        version = self.estado[0]
+        if version == 0 or huella_historial != self.estado[3]:
+            version += 1
+        self.estado = (version, df, informe, huella_historial)
+        self.huella = huella
+        self.cargado_en = time.monotonic()
+        return version
+
+    def invalidar(self):
+        self.cargado_en = None
+
+@st.cache_resource(show_spinner=False)
+def _historial_compartido():
+    return HistorialCompartido()
+
+@contextmanager
+def _bloqueo_entre_procesos(ruta=RUTA_BLOQUEO):
+    """Bloqueo de archivo para varias instancias de la app en la misma máquina (solo POSIX)."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _notificar_version(version):
+    """Avisa a la sesión si el historial ha cambiado (p.ej. otro usuario ha guardado) desde su última lectura."""
+    vista = st.session_state.get('version_historial')
+    if vista is not None and version > vista:
+        st.toast("📥 Hay datos nuevos en el historial: se han cargado automáticamente.")
+    st.session_state['version_historial'] = version
+
+def cargar_datos_gsheet():
+    """Historial compartido (se descarga de Google Sheets como mucho una vez cada TTL_LECTURA)."""
+    try:
+        version, df, _, _ = _historial_compartido().obtener()
+    except Exception as e:
+        # Este print saldrá en la consola negra de Manage App si hay error
+        print(f"Error detalle: {e}")
+        return pd.DataFrame()
+    _notificar_version(version)
+    return df
+
+def refrescar_historial():
+    """Fuerza una nueva descarga en la próxima lectura (botón "Refrescar")."""
+    _historial_compartido().invalidar()
+
+def validar_historial():
+    """Informe de calidad de la última descarga del historial."""
+    try:
+        return _historial_compartido().obtener()[2]
+    except Exception:
+        return InformeValidacion()
+
+def _combinar_snapshot(df_actual, df_nuevo, fecha_snapshot):
+    """Historial actual + snapshot nuevo, listo para subir. Devuelve también las filas nuevas."""
+    # 2. Preparar los datos nuevos (Formato Largo)
+    tipos = [c for c in INVENTARIO_TOTAL.keys() if c in df_nuevo.columns]
+    df_long = df_nuevo.melt(id_vars=['fecha'], value_vars=tipos, var_name='tipo_alojamiento', value_name='cantidad')
+    df_long.rename(columns={'fecha': 'fecha_estancia'}, inplace=True)
+    df_long['fecha_snapshot'] = fecha_snapshot.strftime('%Y-%m-%d')
+
+    # Asegurar tipos en el DF nuevo
+    df_long['fecha_estancia'] = pd.to_datetime(df_long['fecha_estancia'])
+    df_long['fecha_snapshot'] = pd.to_datetime(df_long['fecha_snapshot'])
+
+    if not df_actual.empty:
+        # Asegurar tipos en el DF actual para poder filtrar
+        df_actual['fecha_snapshot'] = parsear_fechas(df_actual['fecha_snapshot'])
+        df_actual['fecha_estancia'] = parsear_fechas(df_actual['fecha_estancia'])
+        df_actual = reconstruir_historial(df_actual)
+
+        # 3. BORRAR si ya existía una carga de ESTA misma fecha (para evitar duplicados si le das 2 veces)
+        snapshot_actual_str = fecha_snapshot.strftime('%Y-%m-%d')
+        # Filtramos para quedarnos con TODO lo que NO sea de hoy
+        df_limpio = df_actual[df_actual['fecha_snapshot'].dt.strftime('%Y-%m-%d') != snapshot_actual_str]
+
+        # 4. Concatenar lo viejo limpio + lo nuevo
+        df_final = pd.concat([df_limpio, df_long], ignore_index=True)
+    else:
+        df_final = df_long
+
+    # 5. COMPACTAR: aplicar retención y guardar solo los cambios entre snapshots
+    if COMPACTAR_HISTORIAL:
+        matriz = aplicar_retencion(expandir_historial(df_final))
+        deltas = compactar_historial(matriz)
+        if comprobar_compactacion(matriz, deltas):
+            df_final = deltas
+        else:
+            # Nunca sobrescribimos el Sheet con deltas que no reproducen el historial: se sube completo
+            print("Aviso: la compactación no reproduce el historial; se guarda sin compactar.")
+            df_final = matriz_a_largo(matriz)
+
+    # Ordenamos un poco para que el Excel se vea bonito
+    df_final = df_final.sort_values(by=['fecha_snapshot', 'fecha_estancia'])
+    return df_final, len(df_long)
+
+def guardar_en_gsheet(df_nuevo, fecha_snapshot):
+    """
+    Añade los datos nuevos al Google Sheet, borrando duplicados de la misma fecha.
+    El leer-modificar-escribir va entero bajo bloqueo: un solo guardado a la vez entre sesiones y
+    entre procesos de la misma máquina (Google Sheets no ofrece una escritura condicional).
+    """
+    compartido = _historial_compartido()
+
+    with compartido.bloqueo, _bloqueo_entre_procesos():
+        # 1. Leer lo que hay actualmente (sin caché: tiene que ser la versión real)
+        df_actual = obtener_conexion().read(worksheet=HOJA_DB, ttl=0)
+        df_final, filas = _combinar_snapshot(df_actual, df_nuevo, fecha_snapshot)
+
+        # 6. SUBIR (Update) al Google Sheet y publicar la nueva versión para todas las sesiones
+        escribir_hoja(HOJA_DB, df_final)
+        st.session_state['version_historial'] = compartido.publicar(df_final)
+
+    return filas
+
+# --- COMPACTACIÓN DEL HISTORIAL ---
+# El Sheet puede tener snapshots completos (formato antiguo) o deltas (columna 'formato' = 'delta').
+# Una celda vacía en 'cantidad' dentro de un delta significa que esa estancia/tipo ya no aparece.
+
+def expandir_historial(df_raw):
+    """Reconstruye la matriz completa (snapshot x estancia/tipo) a partir de snapshots completos o deltas."""
+    df = df_raw.copy()
+    # -1 marca "no aparece en el snapshot" para que sobreviva al pivot y al ffill
+    df['cantidad'] = pd.to_numeric(df['cantidad'], errors='coerce').fillna(-1)
+    matriz = df.pivot_table(index='fecha_snapshot', columns=CLAVE_HISTORIAL, values='cantidad', aggfunc='last')
+
+    if 'formato' in df.columns:
+        es_delta = df.groupby('fecha_snapshot')['formato'].first().eq('delta')
+    else:
+        es_delta = pd.Series(False, index=matriz.index)
+
+    # Un snapshot completo define todas las celdas: lo que no trae, no existe
+    completos = es_delta.index[~es_delta]
+    matriz.loc[completos] = matriz.loc[completos].fillna(-1)
+
+    matriz = matriz.ffill().fillna(-1)
+    return matriz.where(matriz >= 0)
+
+def matriz_a_largo(matriz):
+    """Pasa la matriz al formato largo de siempre (una fila por snapshot, estancia y tipo)."""
+    largo = matriz.unstack().dropna().rename('cantidad').reset_index()
+    return largo[['fecha_estancia', 'tipo_alojamiento', 'cantidad', 'fecha_snapshot']]
+
+def reconstruir_historial(df_raw):
+    """
+    Devuelve el historial con todos los snapshots completos, venga compactado o no.
+    Sin caché propio: el historial compartido ya solo lo reprocesa cuando cambia el contenido del Sheet.
+    """
+    if 'formato' not in df_raw.columns:
+        return df_raw
+    return matriz_a_largo(expandir_historial(df_raw))
+
+def aplicar_retencion(matriz):
+    """Mantiene los snapshots diarios recientes y deja solo el último de cada semana en los antiguos."""
+    fechas = matriz.index.to_series()
+    limite = fechas.max() - pd.Timedelta(days=DIAS_RETENCION_DIARIA)
+    ultimo_de_semana = fechas.groupby(fechas.dt.to_period('W')).transform('max') == fechas
+    return matriz[(fechas >= limite) | ultimo_de_semana]
+
+def compactar_historial(matriz):
+    """Convierte la matriz en deltas: solo las celdas que cambian respecto al snapshot anterior."""
+    actual = matriz.fillna(-1)
+    anterior = actual.shift().fillna(-1)
+    cambios = actual.ne(anterior)
+    # Un snapshot sin cambios conserva una fila para no desaparecer del historial
+    cambios.loc[~cambios.any(axis=1), cambios.columns[0]] = True
+
+    deltas = actual.where(cambios).unstack().dropna().rename('cantidad').reset_index()
+    deltas['cantidad'] = deltas['cantidad'].where(deltas['cantidad'] >= 0)
+    deltas['formato'] = 'delta'
+    return deltas[['fecha_estancia', 'tipo_alojamiento', 'cantidad', 'fecha_snapshot', 'formato']]
+
+def comprobar_compactacion(matriz, deltas):
+    """
+    True si al expandir los deltas se recupera exactamente la matriz: mismos snapshots y mismas
+    celdas (incluidas las que desaparecen). Se comprueba antes de sobrescribir el Sheet.
+    """
+    recuperada = expandir_historial(deltas)
+    if not recuperada.index.equals(matriz.index):
+        return False
+    recuperada = recuperada.reindex(columns=matriz.columns)
+    return bool(recuperada.fillna(-1).eq(matriz.fillna(-1)).all().all())
+
+# --- RITMO VS AÑO ANTERIOR (STLY) ---
+
+def construir_indice_stly(df_hist):
+    """
+    Índice de ritmo: noches reservadas de cada estancia y tipo según la antelación
+    (días entre el snapshot y la llegada), ordenado para consultas rápidas por rango.
+    """
+    if df_hist.empty:
+        return pd.DataFrame(columns=['tipo_alojamiento', 'fecha_estancia', 'antelacion', 'cantidad'])
+
+    indice = df_hist[['tipo_alojamiento', 'fecha_estancia', 'cantidad']].copy()
+    indice['antelacion'] = (df_hist['fecha_estancia'] - df_hist['fecha_snapshot']).dt.days
+    indice = indice[indice['antelacion'] >= 0]
+    indice = indice[['tipo_alojamiento', 'fecha_estancia', 'antelacion', 'cantidad']]
+    return indice.sort_values(['fecha_estancia', 'tipo_alojamiento', 'antelacion']).reset_index(drop=True)
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def _indice_stly(version, huella, _df_hist):
+    # Clave de caché: versión y huella del historial (el guion bajo evita hashear el DataFrame).
+    # La versión vuelve a empezar si se recrea el historial compartido; la huella no se repite.
+    return construir_indice_stly(_df_hist)
+
+def cargar_indice_stly():
+    """
+    Índice STLY del historial actual. Va ligado a su versión: se reconstruye solo cuando cambia.
+    Si el historial no se puede descargar lanza la excepción para que la página muestre el error.
+    """
+    version, df_hist, _, huella = _historial_compartido().obtener()
+    _notificar_version(version)
+    return _indice_stly(version, huella, df_hist)
+
+def _curva_ritmo(indice, tipo, desde, hasta):
+    """Noches reservadas del rango por antelación, solo en las antelaciones observadas para todas las fechas."""
+    sel = indice[(indice['fecha_estancia'] >= desde) & (indice['fecha_estancia'] <= hasta)]
+    if tipo is not None:
+        sel = sel[sel['tipo_alojamiento'] == tipo]
+    if sel.empty:
+        return pd.Series(dtype=float)
+
+    # Suma de tipos por estancia y antelación, una columna por fecha de estancia
+    matriz = sel.pivot_table(index='antelacion', columns='fecha_estancia', values='cantidad', aggfunc='sum')
+    por_fecha = sel.groupby('fecha_estancia')['antelacion']
+    inicio, fin = por_fecha.max().min(), por_fecha.min().max()
+    if inicio < fin:
+        return pd.Series(dtype=float)
+
+    # Entre dos snapshots el valor es el del snapshot anterior (mayor antelación)
+    antelaciones = range(int(matriz.index.max()), int(fin) - 1, -1)
+    matriz = matriz.reindex(antelaciones).ffill()
+    return matriz.loc[inicio:fin].sum(axis=1)
+
+def ritmo_stly(indice, desde, hasta, tipo=None):
+    """
+    Ritmo del rango de estancias frente al mismo rango del año anterior con la misma antelación.
+    El año anterior se desplaza 364 días para comparar el mismo día de la semana.
+    Devuelve una tabla indexada por antelación (de mayor a menor) con 'Actual' y 'Año anterior'.
+    """
+    desplazamiento = pd.Timedelta(days=DIAS_ANIO_ANTERIOR)
+    tabla = pd.DataFrame({
+        'Actual': _curva_ritmo(indice, tipo, desde, hasta),
+        'Año anterior': _curva_ritmo(indice, tipo, desde - desplazamiento, hasta - desplazamiento),
+    })
+    tabla.index.name = 'antelacion'
+    return tabla.sort_index(ascending=False)
+
+# Las figuras de Plotly se memoizan con cache_resource (aquí y en las páginas): devuelve la misma
+# figura sin copiarla, mientras que cache_data la deserializaría y Plotly la volvería a validar entera
+# en cada acierto. Por eso ninguna figura memoizada se modifica después de construirla.
+
+@st.cache_resource(max_entries=20, show_spinner=False)
+def figura_stly(ritmo, color='#00CC96', altura=400):
+    """Curva de ritmo actual frente al año anterior por antelación (tabla de ritmo_stly)."""
+    return go.Figure(
+        data=[
+            go.Scatter(
+                x=ritmo.index, y=ritmo['Año anterior'], name='Año Anterior (STLY)',
+                mode='lines', line=dict(color='#A9A9A9', dash='dash')
+            ),
+            go.Scatter(
+                x=ritmo.index, y=ritmo['Actual'], name='Actual',
+                mode='lines', line=dict(color=color, width=3)
+            ),
+        ],
+        layout=dict(
+            xaxis=dict(title="Días antes de la llegada", autorange="reversed"),
+            yaxis_title="Noches Vendidas",
+            template="plotly_white",
+            height=altura
+        )
+    )
+
+# --- RESUMEN PARA LA PORTADA ---
+
+# Escrituras del resumen entre hilos del mismo proceso (el bloqueo de archivo no existe en Windows)
+_BLOQUEO_RESUMEN = threading.Lock()
+
+def cargar_resumen():
+    """Lee el resumen precalculado. No toca Google Sheets ni Excels."""
+    try:
+        with open(RUTA_RESUMEN, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def guardar_resumen(**valores):
+    """
+    Actualiza solo las claves indicadas del resumen (escritura atómica).
+    Leer-actualizar-escribir bajo bloqueo: dos sesiones a la vez no se pisan las claves.
+    """
+    carpeta = os.path.dirname(RUTA_RESUMEN)
+    os.makedirs(carpeta, exist_ok=True)
+    with _BLOQUEO_RESUMEN, _bloqueo_entre_procesos(RUTA_RESUMEN + ".lock"):
+        resumen = cargar_resumen()
+        resumen.update(valores)
+        # Temporal único por escritura: un nombre fijo lo compartirían todas las sesiones
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=carpeta, suffix=".tmp", delete=False) as f:
+            json.dump(resumen, f, ensure_ascii=False, indent=2)
+        try:
+            os.replace(f.name, RUTA_RESUMEN)
+        except OSError:
+            os.remove(f.name)
+            raise
+
+def actualizar_resumen_historial(df_hist, forzar=False):
+    """
+    Recalcula el pick up y la ocupación On The Books (30/90 días) del último snapshot.
+    Sin forzar, solo recalcula si el historial tiene un snapshot más nuevo que el resumen.
+    """
+    if df_hist.empty:
+        return
+
+    snapshots = df_hist['fecha_snapshot'].drop_duplicates().sort_values()
+    ultimo = snapshots.iloc[-1]
+    if not forzar and cargar_resumen().get('snapshot') == ultimo.strftime('%Y-%m-%d'):
+        return
+
+    actual = df_hist[df_hist['fecha_snapshot'] == ultimo]
+    pickup = None
+    if len(snapshots) > 1:
+        anterior = df_hist[df_hist['fecha_snapshot'] == snapshots.iloc[-2]]
+        pickup = int(actual['cantidad'].sum() - anterior['cantidad'].sum())
+
+    capacidad = sum(INVENTARIO_TOTAL.values())
+    otb = {}
+    for dias in (30, 90):
+        ventana = actual[(actual['fecha_estancia'] >= ultimo) & (actual['fecha_estancia'] < ultimo + pd.Timedelta(days=dias))]
+        ventana = ventana[ventana['tipo_alojamiento'].isin(INVENTARIO_TOTAL.keys())]
+        otb[dias] = round(float(ventana['cantidad'].sum()) / (capacidad * dias) * 100, 1)
+
+    guardar_resumen(
+        snapshot=ultimo.strftime('%Y-%m-%d'),
+        pickup=pickup,
+        otb_30=otb[30],
+        otb_90=otb[90],
+        actualizado_historial=pd.Timestamp.now().strftime('%Y-%m-%d %H:%M'),
+    )
+
+def comprobar_fuentes():
+    """Health check real: mide cuánto tarda cada fuente de datos en responder."""
+    fuentes = {
+        "Google Sheets (historial)": lambda: len(obtener_conexion().read(worksheet=HOJA_DB, ttl=0)),
+        "Resumen precalculado": lambda: len(cargar_resumen()),
+    }
+    resultados = []
+    for nombre, prueba in fuentes.items():
+        inicio = time.perf_counter()
+        try:
+            filas = prueba()
+            estado, detalle = "✅ OK", f"{filas} registros"
+        except Exception as e:
+            estado, detalle = "❌ Error", str(e)
+        resultados.append({
+            "Fuente": nombre,
+            "Estado": estado,
+            "Tiempo (ms)": round((time.perf_counter() - inicio) * 1000, 1),
+            "Detalle": detalle,
+        })
+    return pd.DataFrame(resultados)
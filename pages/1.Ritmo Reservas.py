@@ -1,7 +1,9 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
+import io
 from plotly.subplots import make_subplots
+from datos import INVENTARIO_TOTAL, InformeValidacion, cargar_indice_stly, ritmo_stly, figura_stly
 
 # Configuración de la página
 st.set_page_config(page_title="Analítica de Reservas", layout="wide")
@@ -9,11 +11,57 @@ st.set_page_config(page_title="Analítica de Reservas", layout="wide")
 st.title("📊 Dashboard de Reservas e Ingresos")
 st.write("Sube tus archivos Excel (.xls o .xlsx) para generar la comparativa automáticamente.")
 
+# --- FUNCIONES ---
+# Los gráficos se memoizan por sus datos de entrada: si nada cambia, no se reconstruyen en cada interacción.
+
+@st.cache_data(max_entries=20, show_spinner=False)
+def leer_excel(contenido):
+    """Lee un Excel subido. Memoizado por contenido para no re-parsearlo en cada interacción."""
+    return pd.read_excel(io.BytesIO(contenido))
+
+@st.cache_resource(max_entries=20, show_spinner=False)
+def figura_evolucion(df_grouped):
+    """Reservas e ingresos mensuales por año, con todas las trazas construidas de una vez."""
+    trazas, filas = [], []
+    for anio in sorted(df_grouped['anio'].unique()):
+        datos = df_grouped[df_grouped['anio'] == anio].sort_values('mes')
+        
+        # Reservas
+        trazas.append(go.Scatter(
+            x=datos['nombre_mes'], y=datos['Reservas'],
+            name=f"{anio}", legendgroup=f"{anio}",
+            mode='lines+markers', marker=dict(size=8),
+            hovertemplate=f"<b>Año {anio}</b><br>Mes: %{{x}}<br>Reservas: %{{y}}<extra></extra>"
+        ))
+        # Ingresos
+        trazas.append(go.Scatter(
+            x=datos['nombre_mes'], y=datos['Total_Dep'],
+            name=f"{anio}", legendgroup=f"{anio}", showlegend=False,
+            mode='lines+markers', line=dict(dash='dash'), marker=dict(symbol='square', size=8),
+            hovertemplate=f"<b>Año {anio}</b><br>Mes: %{{x}}<br>Ingresos: %{{y:,.2f}} €<extra></extra>"
+        ))
+        filas += [1, 2]
+
+    fig = make_subplots(
+        rows=2, cols=1,
+        shared_xaxes=True,
+        vertical_spacing=0.1,
+        subplot_titles=("Evolución de RESERVAS", "Evolución de INGRESOS (€)")
+    )
+    fig.add_traces(trazas, rows=filas, cols=[1] * len(trazas))
+    fig.update_layout(
+        height=700, hovermode="x unified", template="plotly_white",
+        yaxis_title="Nº Reservas", yaxis2_title="Euros (€)"
+    )
+    return fig
+
 # 1. Widget para subir archivos
 archivos_subidos = st.file_uploader("Arrastra tus Excels aquí", type=['xls', 'xlsx'], accept_multiple_files=True)
 
 if archivos_subidos:
     lista_dfs = []
+    informe = InformeValidacion()
+    anio_max = pd.Timestamp.today().year + 1
     
     # Barra de progreso
     barra = st.progress(0)
@@ -21,10 +69,16 @@ if archivos_subidos:
     for i, archivo in enumerate(archivos_subidos):
         try:
             # En Streamlit leemos el objeto archivo directamente
-            df = pd.read_excel(archivo)
+            df = leer_excel(archivo.getvalue())
             df.columns = df.columns.str.strip()
             
             if 'anio' in df.columns and 'mes' in df.columns and 'Total_Dep' in df.columns:
+                # Controles de calidad (las filas sin año o mes se descartan igualmente)
+                df['anio'] = informe.numeros(df['anio'], f"{archivo.name}: anio", minimo=2000, maximo=anio_max)
+                df['mes'] = informe.numeros(df['mes'], f"{archivo.name}: mes", minimo=1, maximo=12)
+                for col in ['Reservas', 'Total_Dep']:
+                    if col in df.columns:
+                        df[col] = informe.numeros(df[col], f"{archivo.name}: {col}")
                 df = df.dropna(subset=['anio', 'mes'])
                 lista_dfs.append(df)
             else:
@@ -41,6 +95,13 @@ if archivos_subidos:
         df_total['anio'] = df_total['anio'].astype(int)
         df_total['mes'] = df_total['mes'].astype(int)
         
+        # Filas idénticas suelen ser el mismo archivo subido dos veces (se sumarían dos veces)
+        informe.registrar(
+            "Filas repetidas entre archivos", "aviso", df_total.duplicated(keep=False),
+            df_total['anio'].astype(str) + "-" + df_total['mes'].astype(str)
+        )
+        informe.mostrar()
+        
         # Agrupar datos
         df_grouped = df_total.groupby(['anio', 'mes'])[['Reservas', 'Total_Dep']].sum().reset_index()
         
@@ -49,42 +110,8 @@ if archivos_subidos:
                       7: 'Jul', 8: 'Ago', 9: 'Sep', 10: 'Oct', 11: 'Nov', 12: 'Dic'}
         df_grouped['nombre_mes'] = df_grouped['mes'].map(mapa_meses)
 
-        anios = sorted(df_grouped['anio'].unique())
-
-        # 3. Crear Gráfica Plotly
-        fig = make_subplots(
-            rows=2, cols=1,
-            shared_xaxes=True,
-            vertical_spacing=0.1,
-            subplot_titles=("Evolución de RESERVAS", "Evolución de INGRESOS (€)")
-        )
-
-        for anio in anios:
-            datos = df_grouped[df_grouped['anio'] == anio].sort_values('mes')
-            
-            # Reservas
-            fig.add_trace(
-                go.Scatter(
-                    x=datos['nombre_mes'], y=datos['Reservas'],
-                    name=f"{anio}", legendgroup=f"{anio}",
-                    mode='lines+markers', marker=dict(size=8),
-                    hovertemplate=f"<b>Año {anio}</b><br>Mes: %{{x}}<br>Reservas: %{{y}}<extra></extra>"
-                ), row=1, col=1
-            )
-
-            # Ingresos
-            fig.add_trace(
-                go.Scatter(
-                    x=datos['nombre_mes'], y=datos['Total_Dep'],
-                    name=f"{anio}", legendgroup=f"{anio}", showlegend=False,
-                    mode='lines+markers', line=dict(dash='dash'), marker=dict(symbol='square', size=8),
-                    hovertemplate=f"<b>Año {anio}</b><br>Mes: %{{x}}<br>Ingresos: %{{y:,.2f}} €<extra></extra>"
-                ), row=2, col=1
-            )
-
-        fig.update_layout(height=700, hovermode="x unified", template="plotly_white")
-        fig.update_yaxes(title_text="Nº Reservas", row=1, col=1)
-        fig.update_yaxes(title_text="Euros (€)", row=2, col=1)
+        # 3. Crear Gráfica Plotly (memoizada)
+        fig = figura_evolucion(df_grouped)
 
         # 4. Mostrar en la web
         st.plotly_chart(fig, use_container_width=True)
@@ -96,4 +123,46 @@ if archivos_subidos:
     else:
         st.error("No se pudieron procesar datos válidos.")
 else:
-    st.info("👆 Sube tus archivos Excel para comenzar.")
\ No newline at end of file
+    st.info("👆 Sube tus archivos Excel para comenzar.")
+
+# 5. Ritmo frente al año anterior con la misma antelación (historial de Revenue Management)
+st.divider()
+st.subheader("🔁 Ritmo vs Año Anterior (misma antelación)")
+st.caption("¿Cómo vamos respecto al año pasado a los mismos días de la llegada? Usa los snapshots guardados en Revenue Management.")
+
+# El historial solo se descarga de Google Sheets si se pide la comparativa
+if not st.toggle("Comparar con el año anterior"):
+    st.stop()
+
+try:
+    indice = cargar_indice_stly()
+except Exception as e:
+    st.error(f"❌ No se pudo leer el historial de Google Sheets: {e}")
+    st.stop()
+
+if not indice.empty:
+    meses = indice['fecha_estancia'].dt.to_period('M').drop_duplicates().sort_values(ascending=False)
+    c1, c2 = st.columns(2)
+    with c1:
+        mes = st.selectbox("Mes de estancia:", meses, format_func=lambda m: m.strftime('%m/%Y'))
+    with c2:
+        tipo = st.selectbox("Alojamiento:", ["Todos"] + list(INVENTARIO_TOTAL.keys()))
+    
+    ritmo = ritmo_stly(
+        indice, mes.start_time, mes.end_time.normalize(), None if tipo == "Todos" else tipo
+    )
+    comparable = ritmo.dropna()
+    
+    if not comparable.empty:
+        antelacion_hoy = comparable.index[-1]
+        actual, stly = comparable.iloc[-1]
+        k1, k2 = st.columns(2)
+        k1.metric(f"Noches Actuales ({antelacion_hoy} días antes)", f"{int(actual)}")
+        k2.metric("Mismo Momento Año Anterior", f"{int(stly)}", delta=f"{int(actual - stly)}")
+        
+        fig_stly = figura_stly(ritmo)
+        st.plotly_chart(fig_stly, use_container_width=True)
+    else:
+        st.info("No hay datos del año anterior con la misma antelación para ese mes.")
+else:
+    st.info("Todavía no hay snapshots guardados en Revenue Management.")
\ No newline at end of file
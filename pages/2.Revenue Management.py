@@ -2,85 +2,16 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
-import os
+import io
 import re
 from datetime import datetime
-from streamlit_gsheets import GSheetsConnection
+from datos import (
+    INVENTARIO_TOTAL, DIAS_ESTANCIA_ANTES, DIAS_ESTANCIA_DESPUES, InformeValidacion,
+    cargar_datos_gsheet, guardar_en_gsheet, en_segundo_plano, actualizar_resumen_historial, validar_historial,
+    cargar_indice_stly, ritmo_stly, figura_stly, refrescar_historial
+)
 
-# --- CONFIGURACIÓN ---
-# Inventario (Capacidad total)
-INVENTARIO_TOTAL = {
-    'N-4': 30, 
-    'N-6': 10,
-    'ST2': 2,
-    'ST4': 5,
-    'ST5': 5
-}
-
-# Nombre de la hoja dentro de tu Google Sheet (pestaña inferior)
-HOJA_DB = "Datos"  # Asegúrate de que coincida con tu Google Sheet
-
-# --- FUNCIONES DE BASE DE DATOS (GOOGLE SHEETS) ---
-
-def cargar_datos_gsheet():
-    """Descarga toda la base de datos desde Google Sheets."""
-    conn = st.connection("gsheets", type=GSheetsConnection)
-    try:
-        df = conn.read(worksheet=HOJA_DB)
-        
-        # --- CORRECCIÓN FECHAS EUROPEAS ---
-        if not df.empty and 'fecha_estancia' in df.columns:
-            # dayfirst=True le dice: "El primer número es el día, no el mes"
-            # errors='coerce' le dice: "Si hay una fecha basura, no explotes, ponla vacía (NaT)"
-            df['fecha_estancia'] = pd.to_datetime(df['fecha_estancia'], dayfirst=True, errors='coerce')
-            df['fecha_snapshot'] = pd.to_datetime(df['fecha_snapshot'], dayfirst=True, errors='coerce')
-            
-            # Limpiamos filas que hayan quedado con fechas vacías por error
-            df = df.dropna(subset=['fecha_estancia', 'fecha_snapshot'])
-            
-        return df
-    except Exception as e:
-        # Este print saldrá en la consola negra de Manage App si hay error
-        print(f"Error detalle: {e}") 
-        return pd.DataFrame()
-
-def guardar_en_gsheet(df_nuevo, fecha_snapshot):
-    """Añade los datos nuevos al Google Sheet, borrando duplicados de la misma fecha."""
-    conn = st.connection("gsheets", type=GSheetsConnection)
-    
-    # 1. Leer lo que hay actualmente
-    df_actual = conn.read(worksheet=HOJA_DB)
-    
-    # 2. Preparar los datos nuevos (Formato Largo)
-    tipos = [c for c in INVENTARIO_TOTAL.keys() if c in df_nuevo.columns]
-    df_long = df_nuevo.melt(id_vars=['fecha'], value_vars=tipos, var_name='tipo_alojamiento', value_name='cantidad')
-    df_long.rename(columns={'fecha': 'fecha_estancia'}, inplace=True)
-    df_long['fecha_snapshot'] = fecha_snapshot.strftime('%Y-%m-%d')
-    
-    # Asegurar tipos en el DF nuevo
-    df_long['fecha_estancia'] = pd.to_datetime(df_long['fecha_estancia'])
-    df_long['fecha_snapshot'] = pd.to_datetime(df_long['fecha_snapshot'])
-    
-    if not df_actual.empty:
-        # Asegurar tipos en el DF actual para poder filtrar
-        df_actual['fecha_snapshot'] = pd.to_datetime(df_actual['fecha_snapshot'])
-        
-        # 3. BORRAR si ya existía una carga de ESTA misma fecha (para evitar duplicados si le das 2 veces)
-        snapshot_actual_str = fecha_snapshot.strftime('%Y-%m-%d')
-        # Filtramos para quedarnos con TODO lo que NO sea de hoy
-        df_limpio = df_actual[df_actual['fecha_snapshot'].dt.strftime('%Y-%m-%d') != snapshot_actual_str]
-        
-        # 4. Concatenar lo viejo limpio + lo nuevo
-        df_final = pd.concat([df_limpio, df_long], ignore_index=True)
-    else:
-        df_final = df_long
-
-    # 5. SUBIR (Update) al Google Sheet
-    # Ordenamos un poco para que el Excel se vea bonito
-    df_final = df_final.sort_values(by=['fecha_snapshot', 'fecha_estancia'])
-    conn.update(worksheet=HOJA_DB, data=df_final)
-    
-    return len(df_long)
+# --- FUNCIONES AUXILIARES ---
 
 def obtener_ultimo_snapshot_gsheet(df_hist):
     """Busca el snapshot anterior en el DF descargado."""
@@ -114,19 +45,31 @@ with tab1:
     st.markdown("### 1. Análisis de Pick Up")
     st.info("Los datos se guardan en tu **Google Sheet privado**. No se borrarán al reiniciar.")
     
-    # Cargar base de datos actual al inicio
-    df_hist_global = cargar_datos_gsheet()
-    
     uploaded_file = st.file_uploader("Sube tu Excel actual", type=['xlsx'])
     
+    # El Excel se parsea en segundo plano mientras se descarga el historial
+    lectura_excel = None
+    if uploaded_file is not None:
+        lectura_excel = en_segundo_plano(pd.read_excel, io.BytesIO(uploaded_file.getvalue()))
+    
+    # Cargar base de datos actual
+    df_hist_global = cargar_datos_gsheet()
+    # Mantiene al día los KPIs de la portada si hay un snapshot nuevo
+    actualizar_resumen_historial(df_hist_global)
+    
     if uploaded_file is not None:
         # A) PROCESAR
         fecha_sugerida = extraer_fecha_filename(uploaded_file.name)
+        informe = InformeValidacion()
         
         try:
-            df_actual_wide = pd.read_excel(uploaded_file)
+            df_actual_wide = lectura_excel.result()
             if 'fecha' in df_actual_wide.columns:
-                df_actual_wide['fecha'] = pd.to_datetime(df_actual_wide['fecha'])
+                df_actual_wide['fecha'] = informe.fechas(
+                    df_actual_wide['fecha'], 'fecha',
+                    desde=fecha_sugerida - pd.Timedelta(days=DIAS_ESTANCIA_ANTES),
+                    hasta=fecha_sugerida + pd.Timedelta(days=DIAS_ESTANCIA_DESPUES),
+                )
                 # Renombrar para evitar el error de Merge
                 df_actual_wide_merge = df_actual_wide.rename(columns={'fecha': 'fecha_estancia'})
             else:
@@ -139,6 +82,12 @@ with tab1:
         # Formato largo para comparar
         tipos_disponibles = [c for c in INVENTARIO_TOTAL.keys() if c in df_actual_wide.columns]
         df_actual = df_actual_wide_merge.melt(id_vars=['fecha_estancia'], value_vars=tipos_disponibles, var_name='tipo_alojamiento', value_name='cantidad')
+        
+        # Controles de calidad antes de comparar y guardar
+        df_actual['cantidad'] = informe.numeros(
+            df_actual['cantidad'], 'cantidad', maximo=df_actual['tipo_alojamiento'].map(INVENTARIO_TOTAL)
+        )
+        informe.duplicados(df_actual, ['fecha_estancia', 'tipo_alojamiento'])
 
         # B) BUSCAR EL ANTERIOR EN LA DB DESCARGADA
         df_anterior, fecha_anterior = obtener_ultimo_snapshot_gsheet(df_hist_global)
@@ -157,6 +106,10 @@ with tab1:
             ).fillna(0)
             
             df_merge['pickup'] = df_merge['cantidad_new'] - df_merge['cantidad_old']
+            informe.registrar(
+                "Pick Up negativo (cancelaciones)", "aviso", df_merge['pickup'] < 0,
+                df_merge['fecha_estancia'].astype(str).str[:10] + " " + df_merge['tipo_alojamiento']
+            )
             
             total_pickup = int(df_merge['pickup'].sum())
             cols = st.columns(len(tipos_disponibles) + 1)
@@ -178,13 +131,21 @@ with tab1:
 
         # D) GUARDAR
         st.divider()
+        informe.mostrar("🔎 Calidad del Excel")
+        if informe.hay_errores:
+            st.error("El Excel tiene errores: corrígelos antes de guardar para no ensuciar el historial.")
         fecha_final = st.date_input("Fecha snapshot:", value=fecha_sugerida.date())
         
-        if st.button("☁️ GUARDAR EN GOOGLE SHEETS", type="primary"):
-            with st.spinner("Conectando con Google..."):
-                filas = guardar_en_gsheet(df_actual_wide, fecha_final)
+        if st.button("☁️ GUARDAR EN GOOGLE SHEETS", type="primary", disabled=informe.hay_errores):
+            try:
+                with st.spinner("Conectando con Google..."):
+                    filas = guardar_en_gsheet(df_actual_wide, fecha_final)
+            except Exception as e:
+                st.error(f"❌ No se pudo guardar en Google Sheets: {e}. Espera unos segundos y vuelve a pulsar Guardar.")
+                st.stop()
+            actualizar_resumen_historial(cargar_datos_gsheet(), forzar=True)
             st.success(f"¡Guardado! Tu Google Sheet ahora tiene los datos del {fecha_final}.")
-            st.cache_data.clear() # Limpiar caché para recargar datos frescos
+            # No hace falta limpiar cachés: el guardado ya publica la nueva versión para todas las sesiones
             st.rerun()
 
 # ---------------------------------------------------------
@@ -194,11 +155,12 @@ with tab2:
     st.header("⏳ Análisis de Tendencias y Ocupación")
     
     if st.button("🔄 Refrescar Datos"):
-        st.cache_data.clear()
+        refrescar_historial()
         st.rerun()
         
     # Usamos la variable cargada al inicio
     df_hist = df_hist_global
+    validar_historial().mostrar("🔎 Calidad del historial")
     
     if not df_hist.empty:
         # Filtros Superiores
@@ -295,6 +257,28 @@ with tab2:
                 
                 st.plotly_chart(fig_bar, use_container_width=True)
 
+                # --- GRÁFICA 3: RITMO VS AÑO ANTERIOR (STLY) ---
+                st.divider()
+                st.subheader(f"🔁 Ritmo vs Año Anterior (STLY) - {tipo}")
+                st.caption("Mismas fechas del año pasado (mismo día de la semana) con la misma antelación.")
+                
+                ritmo = ritmo_stly(cargar_indice_stly(), start, end, tipo)
+                comparable = ritmo.dropna()
+                
+                if not comparable.empty:
+                    # Última antelación con datos de los dos años: "dónde estamos hoy"
+                    antelacion_hoy = comparable.index[-1]
+                    actual, stly = comparable.iloc[-1]
+                    k1, k2, k3 = st.columns(3)
+                    k1.metric(f"Noches Actuales ({antelacion_hoy} días antes)", f"{int(actual)}")
+                    k2.metric("Mismo Momento Año Anterior", f"{int(stly)}")
+                    k3.metric("Diferencia", f"{int(actual - stly)}", delta=f"{(actual / stly - 1) * 100:.1f}%" if stly else None)
+                    
+                    fig_stly = figura_stly(ritmo, color='royalblue', altura=350)
+                    st.plotly_chart(fig_stly, use_container_width=True)
+                else:
+                    st.info("No hay datos del año anterior con la misma antelación para este rango.")
+
             else:
                 st.warning("No hay datos para ese rango.")
     else:
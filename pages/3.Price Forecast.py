@@ -1,7 +1,9 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime
 import io
+from datos import InformeValidacion
 
 # --- CONFIGURACIÓN DE LA PÁGINA ---
 st.set_page_config(page_title="Forecasting 2026", layout="wide")
@@ -32,8 +34,8 @@ with st.sidebar:
 
 # --- FUNCIONES ---
 
-def normalizar_datos(df):
-    """Limpia columnas y formatos."""
+def normalizar_datos(df, informe, hoja):
+    """Limpia columnas y formatos, anotando en el informe lo que no cuadra."""
     mapa = {
         'fecha': 'Fecha', 'date': 'Fecha', 
         'precio': 'Precio', 'adr': 'Precio', 
@@ -55,60 +57,69 @@ def normalizar_datos(df):
     for col in ['Precio', 'Ocupacion']:
         if df[col].dtype == object:
             df[col] = df[col].astype(str).str.replace('€','').str.replace('%','').str.replace(',','.').str.strip()
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+        df[col] = informe.numeros(df[col], f"{hoja}: {col}", maximo=100 if col == 'Ocupacion' else None)
     
-    df['Fecha'] = pd.to_datetime(df['Fecha'], dayfirst=True, errors='coerce')
+    df['Fecha'] = informe.fechas(df['Fecha'], f"{hoja}: Fecha")
     df = df.dropna(subset=['Fecha'])
+    informe.registrar(f"Fecha repetida ({hoja})", "aviso", df['Fecha'].duplicated(keep=False), df['Fecha'].dt.date)
     
     # Extraer el año para poder ponderar después
     df['Year'] = df['Fecha'].dt.year
     return df
 
-def leer_excel_completo(file):
+@st.cache_data(max_entries=5, show_spinner=False)
+def leer_excel_completo(id_archivo, _archivo):
+    """
+    Lee todas las pestañas válidas del Excel.
+    Se memoiza por el id de la subida: mover un slider no vuelve a parsear (ni a hashear) el Excel.
+    """
     validos = []
-    try:
-        xls = pd.ExcelFile(file)
-        for sheet in xls.sheet_names:
-            df = pd.read_excel(file, sheet_name=sheet)
-            df_limpio = normalizar_datos(df)
-            if df_limpio is not None and not df_limpio.empty:
-                validos.append(df_limpio)
-                # Mensaje discreto en sidebar
-                st.sidebar.success(f"✅ Leído: {sheet} (Año detectado: {df_limpio['Year'].mode()[0]})")
-    except Exception as e:
-        st.error(f"Error: {e}")
-        return None
-    return pd.concat(validos, ignore_index=True) if validos else None
-
-def calcular_estadisticas_ponderadas(df_total):
+    hojas_leidas = []
+    informe = InformeValidacion()
+    xls = pd.ExcelFile(io.BytesIO(_archivo.getvalue()))
+    for sheet in xls.sheet_names:
+        df = xls.parse(sheet)
+        df_limpio = normalizar_datos(df, informe, sheet)
+        if df_limpio is not None and not df_limpio.empty:
+            validos.append(df_limpio)
+            hojas_leidas.append((sheet, int(df_limpio['Year'].mode()[0])))
+
+    if not validos:
+        return None, hojas_leidas, informe
+
+    df_total = pd.concat(validos, ignore_index=True)
+
+    # Corrección % ocupación
+    df_total['Ocupacion'] = df_total['Ocupacion'].fillna(0)
+    if df_total['Ocupacion'].max() > 1.5:
+        df_total['Ocupacion'] = df_total['Ocupacion'] / 100
+    return df_total, hojas_leidas, informe
+
+@st.cache_data(max_entries=5, show_spinner=False)
+def calcular_estadisticas_ponderadas(id_archivo, _df_total, metodo):
     """
     Calcula la media ponderada dando más peso a los años recientes.
+    Devuelve las estadísticas por día del año y los pesos usados.
     """
-    df_total['MesDia'] = df_total['Fecha'].dt.strftime('%m-%d')
+    df = _df_total.assign(MesDia=_df_total['Fecha'].dt.strftime('%m-%d'))
     
     # 1. Identificar años y asignar pesos
-    years = sorted(df_total['Year'].unique())
+    years = sorted(df['Year'].unique())
     # Fórmula de peso: Posición en la lista (1, 2, 3...)
-    weights = {year: i + 1 for i, year in enumerate(years)}
+    weights = {int(year): i + 1 for i, year in enumerate(years)}
     
-    # Mostrar los pesos usados al usuario
-    if metodo_calculo == "Media Ponderada (Recomendado)":
-        with st.expander("ℹ️ Ver Pesos aplicados por año"):
-            st.write("Cuanto mayor es el peso, más influye en el precio 2026:")
-            st.write(weights)
-        
-        # Aplicar pesos al dataframe
-        df_total['Peso'] = df_total['Year'].map(weights)
+    if metodo == "Media Ponderada (Recomendado)":
+        df['Peso'] = df['Year'].map(weights)
     else:
         # Si es media simple, todos pesan 1
-        df_total['Peso'] = 1
+        df['Peso'] = 1
 
     # 2. Calcular valores ponderados (Precio * Peso)
-    df_total['Precio_Ponderado'] = df_total['Precio'] * df_total['Peso']
-    df_total['Ocupacion_Ponderada'] = df_total['Ocupacion'] * df_total['Peso']
+    df['Precio_Ponderado'] = df['Precio'] * df['Peso']
+    df['Ocupacion_Ponderada'] = df['Ocupacion'] * df['Peso']
 
     # 3. Agrupar por día del año y hacer la media ponderada
-    stats = df_total.groupby('MesDia').agg({
+    stats = df.groupby('MesDia').agg({
         'Precio_Ponderado': 'sum',
         'Ocupacion_Ponderada': 'sum',
         'Peso': 'sum'
@@ -117,18 +128,44 @@ def calcular_estadisticas_ponderadas(df_total):
     stats['Precio_Medio'] = stats['Precio_Ponderado'] / stats['Peso']
     stats['Ocupacion_Media'] = stats['Ocupacion_Ponderada'] / stats['Peso']
     
-    return stats
-
-def aplicar_yield_management(precio_base, ocupacion):
-    ocupacion_decimal = ocupacion / 100 if ocupacion > 1 else ocupacion
-    if ocupacion_decimal >= (umbral_alto / 100):
-        return precio_base * 1.15, "🔥 Subida Agresiva"
-    elif 0.75 <= ocupacion_decimal < (umbral_alto / 100):
-        return precio_base * 1.08, "📈 Subida Moderada"
-    elif (umbral_bajo / 100) <= ocupacion_decimal < 0.75:
-        return precio_base * 1.03, "🛡️ Ajuste IPC"
-    else:
-        return precio_base * 0.95, "🔻 Bajada Estímulo"
+    return stats, weights
+
+@st.cache_data(max_entries=5, show_spinner=False)
+def proyectar_temporada(stats, inicio, fin):
+    """Cruza cada día de la temporada con su estadística histórica (mismo mes-día)."""
+    fechas = pd.date_range(inicio, fin, freq='D')
+    base = pd.DataFrame({'FechaDT': fechas, 'MesDia': fechas.strftime('%m-%d')})
+    base = base.merge(stats[['MesDia', 'Precio_Medio', 'Ocupacion_Media']], on='MesDia', how='inner')
+
+    return pd.DataFrame({
+        'Fecha': base['FechaDT'].dt.strftime('%Y-%m-%d'), # Formato limpio
+        'Día': base['FechaDT'].dt.strftime('%A'),
+        'ADR Histórico': base['Precio_Medio'],
+        'Ocupación Histórica': base['Ocupacion_Media'] * 100,
+    })
+
+def aplicar_yield_management(proyeccion, umbral_alto, umbral_bajo):
+    """
+    Asigna precio y estrategia según la ocupación histórica.
+    Es el único paso que depende de los umbrales, por eso no se memoiza: es vectorizado y casi instantáneo.
+    """
+    ocupacion = proyeccion['Ocupación Histórica'] / 100
+    ocupacion_decimal = np.where(ocupacion > 1, ocupacion / 100, ocupacion)
+    condiciones = [
+        ocupacion_decimal >= (umbral_alto / 100),
+        ocupacion_decimal >= 0.75,
+        ocupacion_decimal >= (umbral_bajo / 100),
+    ]
+    factor = np.select(condiciones, [1.15, 1.08, 1.03], default=0.95)
+    estrategia = np.select(
+        condiciones,
+        ["🔥 Subida Agresiva", "📈 Subida Moderada", "🛡️ Ajuste IPC"],
+        default="🔻 Bajada Estímulo"
+    )
+    return proyeccion.assign(**{
+        'Precio 2026': proyeccion['ADR Histórico'] * factor,
+        'Estrategia': estrategia,
+    })
 
 # Función para colorear la tabla
 def color_estrategia(val):
@@ -145,44 +182,33 @@ uploaded_file = st.file_uploader("Sube tu Excel Histórico (con múltiples pesta
 
 if uploaded_file:
     st.divider()
-    df_total = leer_excel_completo(uploaded_file)
+    try:
+        df_total, hojas_leidas, informe = leer_excel_completo(uploaded_file.file_id, uploaded_file)
+    except Exception as e:
+        st.error(f"Error: {e}")
+        df_total, hojas_leidas, informe = None, [], InformeValidacion()
+
+    for sheet, year in hojas_leidas:
+        # Mensaje discreto en sidebar
+        st.sidebar.success(f"✅ Leído: {sheet} (Año detectado: {year})")
+    informe.mostrar()
     
     if df_total is not None:
-        # Corrección % ocupación
-        df_total['Ocupacion'] = df_total['Ocupacion'].fillna(0)
-        if df_total['Ocupacion'].max() > 1.5:
-            df_total['Ocupacion'] = df_total['Ocupacion'] / 100
-
         # --- CÁLCULO INTELIGENTE ---
-        stats = calcular_estadisticas_ponderadas(df_total)
-        
-        # Generar 2026
-        inicio = datetime(2026, 5, 15)
-        fin = datetime(2026, 9, 13)
-        dias = (fin - inicio).days + 1
+        stats, weights = calcular_estadisticas_ponderadas(uploaded_file.file_id, df_total, metodo_calculo)
+
+        # Mostrar los pesos usados al usuario
+        if metodo_calculo == "Media Ponderada (Recomendado)":
+            with st.expander("ℹ️ Ver Pesos aplicados por año"):
+                st.write("Cuanto mayor es el peso, más influye en el precio 2026:")
+                st.write(weights)
         
-        proyeccion = []
-        for i in range(dias):
-            fecha = inicio + timedelta(days=i)
-            mes_dia = fecha.strftime('%m-%d')
-            row = stats[stats['MesDia'] == mes_dia]
-            
-            if not row.empty:
-                adr = row.iloc[0]['Precio_Medio']
-                occ = row.iloc[0]['Ocupacion_Media']
-                precio_rec, estrategia = aplicar_yield_management(adr, occ)
-                
-                proyeccion.append({
-                    'Fecha': fecha.strftime('%Y-%m-%d'), # Formato limpio
-                    'Día': fecha.strftime('%A'),
-                    'ADR Histórico': adr,
-                    'Ocupación Histórica': occ * 100,
-                    'Precio 2026': precio_rec,
-                    'Estrategia': estrategia
-                })
+        # Generar 2026 (solo el último paso depende de los umbrales)
+        base_2026 = proyectar_temporada(stats, datetime(2026, 5, 15), datetime(2026, 9, 13))
+        proyeccion = aplicar_yield_management(base_2026, umbral_alto, umbral_bajo)
         
-        if proyeccion:
-            df_final = pd.DataFrame(proyeccion)
+        if not proyeccion.empty:
+            df_final = proyeccion
             
             # KPIs Métricas
             c1, c2, c3 = st.columns(3)